@@ -2,12 +2,14 @@
 
 from .filterframes import (
     from_dta_select_filter,
-    to_dta_select_filter
+    to_dta_select_filter,
+    to_dta_select_dataframes
 )
 
 __all__ = [
     'from_dta_select_filter',
-    'to_dta_select_filter'
+    'to_dta_select_filter',
+    'to_dta_select_dataframes'
 ]
 
 __version__ = '0.1.3'
@@ -1,12 +1,24 @@
 """Module providing function for converting between DTASelectFilter.tx files and pandas DataFrame objects"""
+import csv
 import os
 from enum import Enum
 from io import TextIOWrapper, StringIO
 from typing import List, Union, Any, TextIO, Generator
 
+import numpy as np
 import pandas as pd
 
 FILE_TYPES = Union[str, TextIOWrapper, StringIO, TextIO]
+_MAX_PATH_LENGTH = 4096
+
+
+class FileState(Enum):
+    """
+    Enum for specifying the different parts of the DTASelect-filter.txt file
+    """
+    HEADER = 1
+    DATA = 2
+    INFO = 3
 
 
 def _get_lines(file_input: FILE_TYPES) -> Generator[str, None, None]:
@@ -26,21 +38,18 @@ def _get_lines(file_input: FILE_TYPES) -> Generator[str, None, None]:
         ValueError: If the input type is not supported.
     """
     if isinstance(file_input, str): # File path or string
-        if os.path.exists(file_input):
+        # File contents always span multiple lines, so only short single-line strings are probed as paths
+        if len(file_input) < _MAX_PATH_LENGTH and '\n' not in file_input and os.path.isfile(file_input):
             with open(file=file_input, mode='r', encoding='UTF-8') as file:
                 for line in file:
                     yield line.rstrip('\n')
         else:
-            for line in file_input.split('\n'):
+            for line in StringIO(file_input):
                 yield line.rstrip('\n')
-    elif isinstance(file_input, (TextIOWrapper, TextIO)): # TextIOWrapper or StringIO
+    elif isinstance(file_input, (TextIOWrapper, TextIO, StringIO)): # TextIOWrapper or StringIO
         file_input.seek(0)
         for line in file_input:
             yield line.rstrip('\n')
-    elif isinstance(file_input, StringIO): # StringIO
-        file_input.seek(0)
-        for line in file_input.readlines():
-            yield line.rstrip('\n')
     else:
         try:
             for line in file_input:
@@ -49,89 +58,145 @@ def _get_lines(file_input: FILE_TYPES) -> Generator[str, None, None]:
             raise ValueError(f'Unsupported input type: {type(file_input)}!')
 
 
-def _convert_to_best_datatype(values: List[Any]):
+def _convert_to_best_datatype(values: List[Any]) -> np.ndarray:
     """
     Convert a list of values to the most suitable datatype.
 
-    This function tries to convert a list of values to either float, int, or str datatypes, in that order.
+    This function tries to convert a list of values to either int, float, or str arrays, in that order. Each
+    attempt is a single vectorized numpy cast, which fails fast on the first value that does not fit.
 
     Args:
         values (List[Any]): A list of values to be converted.
 
     Returns:
-        list: A list of converted values.
-
-    Raises:
-        ValueError: If unable to convert values to any datatype.
+        np.ndarray: An array of converted values.
     """
 
-    for datatype in [float, int, str]:
+    values = np.asarray(values, dtype=object)
+
+    for datatype in [np.int64, np.float64]:
         try:
-            converted_values = [datatype(value) for value in values]
-            return converted_values
-        except (ValueError, TypeError):
+            return values.astype(datatype)
+        except (ValueError, TypeError, OverflowError):
             continue
-    raise ValueError("Unable to convert values to any datatype")
+    return values
+
+
+def _get_protein_groups(is_peptide: np.ndarray) -> np.ndarray:
+    """
+    Assign a protein group to each data line.
+
+    A protein group is one or more consecutive protein lines followed by their peptide lines, so a new group starts
+    at every protein line that follows a peptide line.
+
+    Args:
+        is_peptide (np.ndarray): A boolean array marking the peptide lines.
+
+    Returns:
+        np.ndarray: The protein group of each data line.
+    """
+
+    group_starts = np.zeros(len(is_peptide), dtype=np.int64)
+    group_starts[1:] = ~is_peptide[1:] & is_peptide[:-1]
+    return np.cumsum(group_starts)
 
 
-def _create_file_name(peptide_row: pd.Series) -> str:
+def _read_data_lines(data_lines: List[str], columns: List[str], protein_groups: np.ndarray) -> pd.DataFrame:
     """
-    Create a file name from a given peptide row.
+    Read protein or peptide lines of a DTASelect-filter.txt file into a typed dataframe.
 
-    This function constructs a file name string from the FileName, LowScan, HighScan, and Charge
-    fields of a given peptide row.
+    The lines are tokenized and typed in a single pass by the pandas C parser, so numeric columns never go through
+    an intermediate column of strings. Floats are parsed with round trip precision, and no values are treated as NA,
+    so the lines can be written back unchanged. Rows with fewer fields than columns are padded with empty strings.
 
     Args:
-        peptide_row (pd.Series): A row from a peptide dataframe.
+        data_lines (List[str]): The protein or peptide lines.
+        columns (List[str]): The column names.
+        protein_groups (np.ndarray): The protein group of each line.
 
     Returns:
-        str: The constructed file name string.
+        pd.DataFrame: The typed dataframe, with an additional int ProteinGroup column.
     """
 
-    return f"{peptide_row['FileName']}.{peptide_row['LowScan']}.{peptide_row['HighScan']}.{peptide_row['Charge']}"
+    if data_lines:
+        num_fields = max([len(columns)] + [line.count('\t') + 1 for line in data_lines])
+        data_str = '\n'.join(data_lines)
+        read_kwargs = {'sep': '\t', 'header': None, 'names': range(num_fields), 'usecols': range(len(columns)),
+                       'engine': 'c', 'low_memory': False, 'quoting': csv.QUOTE_NONE, 'keep_default_na': False,
+                       'float_precision': 'round_trip', 'skip_blank_lines': False}
+        dataframe = pd.read_csv(StringIO(data_str), **read_kwargs)
+
+        # The C parser turns true/false values into booleans, re-read those columns as strings to keep their case
+        bool_columns = [column for column in dataframe.columns if pd.api.types.is_bool_dtype(dataframe[column])]
+        if bool_columns:
+            dataframe = pd.read_csv(StringIO(data_str), dtype={column: object for column in bool_columns},
+                                    **read_kwargs)
+
+        # Integers outside the int64/uint64 range are left as Python ints in an object column, read those as floats
+        for column in dataframe.columns:
+            if dataframe[column].dtype == object and pd.api.types.infer_dtype(dataframe[column]) == 'integer':
+                dataframe[column] = dataframe[column].astype(np.float64)
+    else:
+        dataframe = pd.DataFrame(columns=range(len(columns)), dtype=object)
 
+    dataframe.columns = columns
+    dataframe['ProteinGroup'] = protein_groups
+    return dataframe
 
-def _reorder_columns(dataframe: pd.DataFrame, column: str, new_position: int) -> pd.DataFrame:
+
+def _create_file_names(peptide_df: pd.DataFrame) -> pd.Series:
     """
-    Reorder columns in a dataframe by moving a specified column to a new position.
+    Create file names for all rows of a given peptide dataframe.
+
+    This function constructs the file name strings from the FileName, LowScan, HighScan, and Charge
+    columns of a given peptide dataframe using vectorized string concatenation.
 
     Args:
-        dataframe (pd.DataFrame): The input dataframe.
-        column (str): The column to be moved.
-        new_position (int): The new position for the specified column.
+        peptide_df (pd.DataFrame): A peptide dataframe.
 
     Returns:
-        pd.DataFrame: A dataframe with reordered columns.
+        pd.Series: The constructed file name strings.
     """
 
-    columns = dataframe.columns.tolist()
-    columns.insert(new_position, columns.pop(columns.index(column)))
-    return dataframe[columns]
+    file_names = peptide_df['FileName']
+    # StringDtype columns are concatenated as is, all other columns are converted to str first
+    if not isinstance(file_names.dtype, pd.StringDtype):
+        file_names = file_names.astype(str)
+
+    return (file_names + '.' +
+            peptide_df['LowScan'].astype(str) + '.' +
+            peptide_df['HighScan'].astype(str) + '.' +
+            peptide_df['Charge'].astype(str))
 
 
 def _write_lines(file_output, lines):
     """
     Write a list of lines to a given file output.
 
+    The lines are joined and written with a single write call.
+
     Args:
         file_output (TextIOWrapper or StringIO): The output file object.
         lines (list): A list of lines to be written.
     """
 
-    for line in lines:
-        file_output.write(line + '\n')
+    if lines:
+        file_output.write('\n'.join(lines) + '\n')
 
 
-def from_dta_select_filter(file_input: Union[str, TextIOWrapper, StringIO, TextIO]) -> (
+def from_dta_select_filter(file_input: Union[str, TextIOWrapper, StringIO, TextIO], categorize: bool = True) -> (
         List[str], pd.DataFrame, pd.DataFrame, List[str]):
     """
     Process the given file and extract relevant information to create peptide and protein dataframes.
 
-    This function reads the input file and processes it line by line to create peptide and protein
-    dataframes, as well as lists of header lines and end lines (information lines).
+    This function splits the input file into its header, protein, peptide and info lines, and reads the protein
+    and peptide lines with the pandas C parser to create peptide and protein dataframes, as well as lists of
+    header lines and end lines (information lines).
 
     Args:
         file_input (Union[str, TextIOWrapper, StringIO]): The input file as a string, TextIOWrapper, or StringIO.
+        categorize (bool): Whether to store the peptide FileName column as a category. Set to False to keep it as a
+            string column, e.g. when the dataframes are only passed on to to_dta_select_filter.
 
     Returns:
         tuple: A tuple containing the following elements:
@@ -143,79 +208,61 @@ def from_dta_select_filter(file_input: Union[str, TextIOWrapper, StringIO, TextI
 
     lines = _get_lines(file_input)
 
-    class FileState(Enum):
-        """
-        Enum for specifying the different parts of the DTASelect-filter.txt file
-        """
-        HEADER = 1
-        DATA = 2
-        INFO = 3
+    # Local bindings for the file states compared on every line
+    header_state, data_state, info_state = FileState.HEADER, FileState.DATA, FileState.INFO
 
-    file_state = FileState.HEADER
+    file_state = header_state
 
     header_lines, end_lines = [], []
-    peptide_data, protein_data = None, None
-    current_protein_grp, peptide_line_cnt = 0, 0
-
-    for i, line in enumerate(lines):
-        line_elements = line.rstrip().split("\t")
-
-        if line.startswith('Locus'):  # Protein Line Header
-            protein_data = {key: [] for key in line_elements}
-            protein_data['ProteinGroup'] = []
-
-        if line.startswith('Unique'):  # Peptide Line Header
-            peptide_data = {key: [] for key in line_elements}
-            peptide_data['ProteinGroup'] = []
-
-            header_lines.append(line)
-            file_state = FileState.DATA
-            continue
-
-        if len(line_elements) > 1 and line_elements[1] == "Proteins":
-            file_state = FileState.INFO
-
-        if file_state == FileState.HEADER:
-            header_lines.append(line)
+    peptide_lines, protein_lines, line_is_peptide = [], [], []
+    peptide_columns, protein_columns = None, None
 
-        if file_state == FileState.DATA:
-            if line_elements[0] == '' or '*' in line_elements[0] or line_elements[0].isnumeric():
+    # Local bindings for the list appends used on every data line
+    append_peptide_line, append_protein_line = peptide_lines.append, protein_lines.append
+    append_line_kind = line_is_peptide.append
 
-                for key, value in zip(peptide_data, line_elements):
-                    peptide_data[key].append(value)
-                peptide_data['ProteinGroup'].append(current_protein_grp)
-
-                peptide_line_cnt += 1
+    for line in lines:
+        if file_state is data_state:
+            if '\tProteins' in line and line.rstrip().split("\t")[1] == "Proteins":
+                file_state = info_state
+                end_lines.append(line)
+                continue
+
+            line = line.rstrip()
+            first_char = line[:1]
+
+            # Peptide lines start with an empty, '*' or numeric unique field, all other data lines are protein lines
+            if first_char in ('', '\t', '*') or (first_char.isdigit() and line.partition("\t")[0].isdigit()):
+                append_peptide_line(line)
+                append_line_kind(True)
             else:
-                if peptide_line_cnt != 0:
-                    current_protein_grp += 1
-                    peptide_line_cnt = 0
-
-                for key, value in zip(protein_data, line_elements):
-                    protein_data[key].append(value)
-                protein_data['ProteinGroup'].append(current_protein_grp)
+                append_protein_line(line)
+                append_line_kind(False)
+        elif file_state is header_state:
+            header_lines.append(line)
 
-        if file_state == FileState.INFO:
+            if line.startswith('Locus'):  # Protein Line Header
+                protein_columns = line.rstrip().split("\t")
+            elif line.startswith('Unique'):  # Peptide Line Header
+                peptide_columns = line.rstrip().split("\t")
+                file_state = data_state
+        else:
             end_lines.append(line)
 
-    for k in peptide_data:
-        peptide_data[k] = _convert_to_best_datatype(peptide_data[k])
+    is_peptide = np.array(line_is_peptide, dtype=bool)
+    protein_groups = _get_protein_groups(is_peptide)
 
-    for k in protein_data:
-        protein_data[k] = _convert_to_best_datatype(protein_data[k])
+    peptide_df = _read_data_lines(peptide_lines, peptide_columns, protein_groups[is_peptide])
+    protein_df = _read_data_lines(protein_lines, protein_columns, protein_groups[~is_peptide])
 
-    peptide_df = pd.DataFrame(peptide_data)
-    protein_df = pd.DataFrame(protein_data)
+    # FileName is <file>.<low scan>.<high scan>.<charge>, split from the right since the file part may contain dots
+    file_name_components = peptide_df.pop('FileName').astype(str).str.rsplit('.', n=3, expand=True)
+    file_name_components = file_name_components.reindex(columns=range(4))
 
-    file_name_components = [fn.split('.') for fn in peptide_df['FileName']]
-    peptide_df.drop(['FileName'], axis=1, inplace=True)
-
-    peptide_df['FileName'] = _convert_to_best_datatype([comp[0] for comp in file_name_components])
-    peptide_df['FileName'] = peptide_df['FileName'].astype('category')
-
-    peptide_df['LowScan'] = _convert_to_best_datatype([comp[1] for comp in file_name_components])
-    peptide_df['HighScan'] = _convert_to_best_datatype([comp[2] for comp in file_name_components])
-    peptide_df['Charge'] = _convert_to_best_datatype([comp[3] for comp in file_name_components])
+    peptide_df['FileName'] = file_name_components[0].astype('category') if categorize else file_name_components[0]
+    peptide_df['LowScan'] = _convert_to_best_datatype(file_name_components[1])
+    peptide_df['HighScan'] = _convert_to_best_datatype(file_name_components[2])
+    peptide_df['Charge'] = _convert_to_best_datatype(file_name_components[3])
 
     peptide_df = peptide_df.convert_dtypes()
     protein_df = protein_df.convert_dtypes()
@@ -244,28 +291,15 @@ def to_dta_select_filter(header_lines: List[str], peptide_df: pd.DataFrame, prot
         StringIO: A StringIO object containing the reformatted data in DTASelect-filter.txt format.
     """
 
-    peptide_df = peptide_df.copy(deep=True)
-    protein_df = protein_df.copy(deep=True)
-
-    file_output = StringIO()
+    # Build protein and peptide data. The inputs are never modified, so only the rebuilt FileName column is allocated.
+    peptide_out_df = peptide_df.drop(['FileName', 'LowScan', 'HighScan', 'Charge', 'ProteinGroup'], axis=1)
+    # Insert FileName as the second column
+    peptide_out_df.insert(1, 'FileName', _create_file_names(peptide_df))
+    protein_out_df = protein_df.drop(['ProteinGroup'], axis=1)
 
-    # Write header lines
-    _write_lines(file_output, header_lines)
+    protein_data_str = protein_out_df.to_csv(header=False, index=False, sep='\t', lineterminator='\n')
+    peptide_data_str = peptide_out_df.to_csv(header=False, index=False, sep='\t', lineterminator='\n')
 
-    # Write protein and peptide data
-    concatenated_file_names = peptide_df.apply(_create_file_name, axis=1)
-    peptide_df.drop(['FileName', 'LowScan', 'HighScan', 'Charge'], axis=1, inplace=True)
-    peptide_df['FileName'] = concatenated_file_names
-    # Re-order columns to make FileName the second column
-    peptide_df = _reorder_columns(peptide_df, 'FileName', 1)
-
-    protein_data_str = protein_df.drop(['ProteinGroup'], axis=1).to_csv(header=False, index=False, sep='\t')
-    peptide_data_str = peptide_df.drop(['ProteinGroup'], axis=1).to_csv(header=False, index=False, sep='\t')
-
-    protein_data_str = protein_data_str.replace('\r', '')
-    peptide_data_str = peptide_data_str.replace('\r', '')
-
-    current_protein_grp = 0
     protein_lines = protein_data_str.split('\n')
     peptide_lines = peptide_data_str.split('\n')
 
@@ -275,25 +309,76 @@ def to_dta_select_filter(header_lines: List[str], peptide_df: pd.DataFrame, prot
     if peptide_lines[-1] == '':
         peptide_lines = peptide_lines[:-1]
 
-    protein_line_idx = 0
-    peptide_line_idx = 0
+    # Interleave the lines so that each protein group's protein lines precede its peptide lines. A stable sort on
+    # (ProteinGroup, kind) keeps the original row order within each group.
+    data_lines = protein_lines + peptide_lines
+    groups = np.concatenate((protein_df['ProteinGroup'].to_numpy(dtype='int64'),
+                             peptide_df['ProteinGroup'].to_numpy(dtype='int64')))
+    kinds = np.concatenate((np.zeros(len(protein_lines), dtype='int8'), np.ones(len(peptide_lines), dtype='int8')))
+    order = np.lexsort((kinds, groups))
 
-    while protein_line_idx < len(protein_lines) and peptide_line_idx < len(peptide_lines):
-        if int(protein_df.iloc[protein_line_idx]['ProteinGroup']) == current_protein_grp:
-            file_output.write(protein_lines[protein_line_idx] + '\n')
-            protein_line_idx += 1
-        else:
-            file_output.write(peptide_lines[peptide_line_idx] + '\n')
-            peptide_line_idx += 1
-            if peptide_line_idx < len(peptide_lines) and int(
-                    peptide_df.iloc[peptide_line_idx - 1]['ProteinGroup']) != int(
-                peptide_df.iloc[peptide_line_idx]['ProteinGroup']):
-                current_protein_grp += 1
+    # Write header, protein and peptide data, and end lines with a single write
+    file_output = StringIO()
+    _write_lines(file_output, header_lines + [data_lines[i] for i in order.tolist()] + end_lines)
 
-    # Write remaining protein and peptide lines
-    _write_lines(file_output, protein_lines[protein_line_idx:])
-    _write_lines(file_output, peptide_lines[peptide_line_idx:])
+    return file_output
 
-    _write_lines(file_output, end_lines)
 
-    return file_output
+def to_dta_select_dataframes(header_lines: List[str], peptide_df: pd.DataFrame, protein_df: pd.DataFrame,
+                             end_lines: List[str], copy: bool = True) -> (
+        List[str], pd.DataFrame, pd.DataFrame, List[str]):
+    """
+    Re-link the given header lines, peptide and protein dataframes, and end lines without serializing them.
+
+    This function is the in-memory counterpart of passing the output of to_dta_select_filter back into
+    from_dta_select_filter. The rows are put in the order they are written in, and ProteinGroup is re-linked with
+    the same rule used when parsing, so a protein line without peptide lines joins the next protein group and
+    peptide lines without protein lines join the previous one. Unused FileName categories are removed and the
+    columns are converted with convert_dtypes, as when parsing. No DTASelect-filter.txt text is written or parsed.
+    The StringIO form from to_dta_select_filter is only needed to persist the data.
+
+    Args:
+        header_lines (List[str]): A list of header lines.
+        peptide_df (pd.DataFrame): A dataframe containing peptide data.
+        protein_df (pd.DataFrame): A dataframe containing protein data.
+        end_lines (List[str]): A list of end lines (information lines).
+        copy (bool): Whether to return copies of the header and end lines, and of the dataframes when their rows
+            are already in order. If False and no rows are reordered, the returned dataframes may share data with
+            the inputs. Reordered dataframes never share data with the inputs.
+
+    Returns:
+        tuple: A tuple containing the following elements:
+            - header_lines (List[str]): A list of header lines.
+            - peptide_df (pd.DataFrame): A dataframe containing peptide data.
+            - protein_df (pd.DataFrame): A dataframe containing protein data.
+            - end_lines (List[str]): A list of end lines (information lines).
+    """
+
+    # Order the rows as to_dta_select_filter writes them, then re-link the groups as from_dta_select_filter does
+    groups = np.concatenate((protein_df['ProteinGroup'].to_numpy(dtype='int64'),
+                             peptide_df['ProteinGroup'].to_numpy(dtype='int64')))
+    kinds = np.concatenate((np.zeros(len(protein_df), dtype='int8'), np.ones(len(peptide_df), dtype='int8')))
+    order = np.lexsort((kinds, groups))
+    is_peptide = kinds[order] == 1
+    relinked_groups = _get_protein_groups(is_peptide)
+
+    in_order = np.array_equal(order, np.arange(len(order)))
+
+    dataframes = []
+    for dataframe, positions, dataframe_groups in (
+            (peptide_df, order[is_peptide] - len(protein_df), relinked_groups[is_peptide]),
+            (protein_df, order[~is_peptide], relinked_groups[~is_peptide])):
+        # Reordering already builds new frames, so the inputs only need to be copied when the order is unchanged
+        dataframe = dataframe.copy(deep=copy) if in_order else dataframe.take(positions)
+        dataframe.index = pd.RangeIndex(len(dataframe))
+        dataframe['ProteinGroup'] = dataframe_groups
+
+        # Normalize the dtypes the same way from_dta_select_filter does
+        if 'FileName' in dataframe and isinstance(dataframe['FileName'].dtype, pd.CategoricalDtype):
+            dataframe['FileName'] = dataframe['FileName'].cat.remove_unused_categories()
+        dataframes.append(dataframe.convert_dtypes())
+
+    if copy:
+        header_lines, end_lines = list(header_lines), list(end_lines)
+
+    return header_lines, dataframes[0], dataframes[1], end_lines
@@ -2,7 +2,7 @@ from io import StringIO
 
 import pandas as pd
 
-from filterframes import from_dta_select_filter, to_dta_select_filter
+from filterframes import from_dta_select_filter, to_dta_select_filter, to_dta_select_dataframes
 
 
 def test_from_dta_select_filter_to_df_V2_1_12_paser():
@@ -45,3 +45,95 @@ def test_from_dta_select_filter_to_df_V2_1_13():
     pd.testing.assert_frame_equal(peptide_df, peptide_df3)
     assert head_lines == head_lines3
     assert tail_lines == tail_lines3
+
+
+def test_from_dta_select_filter_protein_groups_V2_1_13():
+    head_lines, peptide_df, protein_df, tail_lines = from_dta_select_filter('tests/data/DTASelect-filter_V2_1_13.txt')
+
+    # Consecutive protein lines share a protein group
+    assert protein_df['ProteinGroup'].tolist() == [0, 1, 2, 3, 4, 5, 5, 6]
+    assert sorted(peptide_df['ProteinGroup'].unique().tolist()) == [0, 1, 2, 3, 4, 5, 6]
+
+
+def test_from_dta_select_filter_categorize_V2_1_13():
+    head_lines, peptide_df, protein_df, tail_lines = from_dta_select_filter('tests/data/DTASelect-filter_V2_1_13.txt')
+    head_lines2, peptide_df2, protein_df2, tail_lines2 = from_dta_select_filter(
+        'tests/data/DTASelect-filter_V2_1_13.txt', categorize=False)
+
+    assert isinstance(peptide_df['FileName'].dtype, pd.CategoricalDtype)
+    assert not isinstance(peptide_df2['FileName'].dtype, pd.CategoricalDtype)
+    assert peptide_df['FileName'].astype(str).tolist() == peptide_df2['FileName'].tolist()
+
+    io = to_dta_select_filter(head_lines, peptide_df, protein_df, tail_lines)
+    io2 = to_dta_select_filter(head_lines2, peptide_df2, protein_df2, tail_lines2)
+    assert io.getvalue() == io2.getvalue()
+
+
+def test_to_dta_select_dataframes_V2_1_13():
+    head_lines, peptide_df, protein_df, tail_lines = from_dta_select_filter('tests/data/DTASelect-filter_V2_1_13.txt')
+
+    io = to_dta_select_filter(head_lines, peptide_df, protein_df, tail_lines)
+    head_lines2, peptide_df2, protein_df2, tail_lines2 = from_dta_select_filter(io)
+    head_lines3, peptide_df3, protein_df3, tail_lines3 = to_dta_select_dataframes(head_lines, peptide_df, protein_df,
+                                                                                  tail_lines)
+    pd.testing.assert_frame_equal(peptide_df2, peptide_df3)
+    pd.testing.assert_frame_equal(protein_df2, protein_df3)
+    assert head_lines2 == head_lines3
+    assert tail_lines2 == tail_lines3
+
+
+def test_to_dta_select_dataframes_filtered_V2_1_13():
+    head_lines, peptide_df, protein_df, tail_lines = from_dta_select_filter('tests/data/DTASelect-filter_V2_1_13.txt')
+
+    # Group 2 loses its peptides, group 4 loses its protein, and the rows are shuffled
+    peptide_df = peptide_df[peptide_df['ProteinGroup'] != 2].sample(frac=1, random_state=0)
+    protein_df = protein_df[protein_df['ProteinGroup'] != 4].sample(frac=1, random_state=0)
+
+    io = to_dta_select_filter(head_lines, peptide_df, protein_df, tail_lines)
+    head_lines2, peptide_df2, protein_df2, tail_lines2 = from_dta_select_filter(io)
+    head_lines3, peptide_df3, protein_df3, tail_lines3 = to_dta_select_dataframes(head_lines, peptide_df, protein_df,
+                                                                                  tail_lines)
+    assert protein_df2['ProteinGroup'].tolist() == [0, 1, 2, 2, 3, 3, 4]
+    pd.testing.assert_frame_equal(peptide_df2, peptide_df3)
+    pd.testing.assert_frame_equal(protein_df2, protein_df3)
+    assert head_lines2 == head_lines3
+    assert tail_lines2 == tail_lines3
+
+
+def test_from_dta_select_filter_bool_like_values_V2_1_13():
+    head_lines, peptide_df, protein_df, tail_lines = from_dta_select_filter('tests/data/DTASelect-filter_V2_1_13.txt')
+    protein_df['Validation Status'] = ['true', 'false', 'True', 'FALSE', 'true', 'true', 'false', 'true']
+
+    io = to_dta_select_filter(head_lines, peptide_df, protein_df, tail_lines)
+    head_lines2, peptide_df2, protein_df2, tail_lines2 = from_dta_select_filter(io)
+    assert protein_df2['Validation Status'].tolist() == protein_df['Validation Status'].tolist()
+
+
+def test_from_dta_select_filter_large_int_values_V2_1_13():
+    head_lines, peptide_df, protein_df, tail_lines = from_dta_select_filter('tests/data/DTASelect-filter_V2_1_13.txt')
+    total_intensity = peptide_df['TotalIntensity'].astype(object)
+    total_intensity.iloc[::2] = 99999999999999999999
+    peptide_df['TotalIntensity'] = total_intensity
+
+    io = to_dta_select_filter(head_lines, peptide_df, protein_df, tail_lines)
+    head_lines2, peptide_df2, protein_df2, tail_lines2 = from_dta_select_filter(io)
+    assert peptide_df2['TotalIntensity'].tolist() == [float(value) for value in total_intensity]
+
+
+def test_to_dta_select_dataframes_filtered_file_name_V2_1_13():
+    head_lines, peptide_df, protein_df, tail_lines = from_dta_select_filter('tests/data/DTASelect-filter_V2_1_13.txt')
+
+    # Add a second run, then filter all of its rows out, and cast a column away from its parsed dtype
+    file_names = peptide_df['FileName'].astype(str)
+    file_names.iloc[::2] = 'otherrun'
+    peptide_df['FileName'] = file_names.astype('category')
+    peptide_df = peptide_df[peptide_df['FileName'] != 'otherrun'].copy()
+    peptide_df['XCorr'] = peptide_df['XCorr'].astype('float64')
+
+    io = to_dta_select_filter(head_lines, peptide_df, protein_df, tail_lines)
+    head_lines2, peptide_df2, protein_df2, tail_lines2 = from_dta_select_filter(io)
+    head_lines3, peptide_df3, protein_df3, tail_lines3 = to_dta_select_dataframes(head_lines, peptide_df, protein_df,
+                                                                                  tail_lines)
+    assert peptide_df3['FileName'].cat.categories.tolist() == ['190806_300ng_180m_03_Slot2-3_1_646_nopd']
+    pd.testing.assert_frame_equal(peptide_df2, peptide_df3)
+    pd.testing.assert_frame_equal(protein_df2, protein_df3)